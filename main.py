@@ -1,55 +1,147 @@
 import os
-from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+import asyncio
+import logging
+import orjson
+from typing import List, Optional, Dict, Any, Tuple
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
 from bson import ObjectId
+from pymongo import ReturnDocument, WriteConcern
+from pymongo.errors import ConnectionFailure, PyMongoError
 from datetime import datetime, timezone
 
-from database import db
+from database import async_db as db
 
-app = FastAPI(title="Justifi API (MVP)")
+logger = logging.getLogger(__name__)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+def _json_default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """orjson response that also understands ObjectId (datetimes are native)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+CORS_PREFLIGHT_HEADERS = CORS_HEADERS + [
+    (b"access-control-allow-methods", b"GET, POST, PUT, PATCH, DELETE, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-max-age", b"600"),
+]
+
+
+class PublicCORSMiddleware:
+    """Wildcard CORS with static headers; preflights are answered without routing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] == "OPTIONS":
+            await send({"type": "http.response.start", "status": 204, "headers": CORS_PREFLIGHT_HEADERS})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + CORS_HEADERS
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app = FastAPI(title="Justifi API (MVP)", default_response_class=MongoJSONResponse)
+
+# No credentialed CORS: the API uses no cookies, and browsers reject them with a wildcard origin
+app.add_middleware(PublicCORSMiddleware)
 
 
 # Utility -------------------------------------------------
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v):
-        if isinstance(v, ObjectId):
-            return v
-        try:
-            return ObjectId(str(v))
-        except Exception:
-            raise ValueError("Invalid ObjectId")
+def parse_object_id(value: str) -> ObjectId:
+    if not ObjectId.is_valid(value):
+        raise HTTPException(400, "Invalid id")
+    return ObjectId(value)
+
+
+def justification_ref(task: Dict[str, Any]) -> ObjectId:
+    # Tasks written before the ObjectId migration (or by old workers) hold a hex string
+    ref = task.get("justification_id")
+    if isinstance(ref, str):
+        if not ObjectId.is_valid(ref):
+            raise HTTPException(404, "Justification not found")
+        return ObjectId(ref)
+    return ref
+
+
+def ref_matches(field: str, var: str = "$$j") -> Dict[str, Any]:
+    # $expr matching a child's reference against either form of the justification id
+    return {"$in": [field, [var, {"$toString": var}]]}
+
+
+# Summary fields returned by list views; the detail endpoint returns the full document
+JUSTIFICATION_SUMMARY_PROJECTION = {
+    "title": 1,
+    "status": 1,
+    "requester_email": 1,
+    "department": 1,
+    "type_code": 1,
+    "cost_estimate": 1,
+    "urgency": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+
+# The inbox only shows who asked, for what and how much
+INBOX_JUSTIFICATION_PROJECTION = {
+    "title": 1,
+    "status": 1,
+    "requester_email": 1,
+    "department": 1,
+    "cost_estimate": 1,
+    "urgency": 1,
+    "created_at": 1,
+}
+
+# What the notification emails need from a justification
+REQUESTER_PROJECTION = {"requester_email": 1, "title": 1}
+
+# Rendered list_justifications bodies keyed by the query parameters.
+# Cleared on every justification write; the short TTL covers other workers.
+_list_cache: TTLCache = TTLCache(maxsize=1024, ttl=5)
+# Bumped on every clear so a read that overlapped a write doesn't cache its stale body
+_list_generation = 0
+
+
+def invalidate_list_cache():
+    global _list_generation
+    _list_generation += 1
+    _list_cache.clear()
 
 
 def serialize_id(doc: Dict[str, Any]):
-    if not doc:
-        return doc
-    doc = dict(doc)
-    if "_id" in doc:
+    # Docs come fresh off the cursor, so rename in place; datetimes and
+    # ObjectId references are left for MongoJSONResponse.
+    if doc and "_id" in doc:
         doc["id"] = str(doc.pop("_id"))
-    # Convert datetime objects
-    for k, v in list(doc.items()):
-        if isinstance(v, datetime):
-            doc[k] = v.isoformat()
     return doc
 
 
 # Schemas -------------------------------------------------
 class JustificationCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     title: str
     type_code: str
     department: str
@@ -66,65 +158,151 @@ class JustificationCreate(BaseModel):
 
 
 class CommentCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     author_email: str
     message: str
     is_internal: bool = False
 
 
 class ApproverAction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     actor_email: str
     comment: Optional[str] = None
 
 
 class RequestInfoAction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     actor_email: str
     reason: str
 
 
 class ResubmitPayload(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     actor_email: str
     message: Optional[str] = None
 
 
 # Routing selection --------------------------------------
 
-def select_routing_rule(department: str, type_code: str, spend: Optional[float]) -> Optional[Dict[str, Any]]:
-    candidates = []
-    if department and type_code:
-        candidates.append({"department": department, "type_code": type_code})
-    if type_code:
-        candidates.append({"type_code": type_code})
-    if department:
-        candidates.append({"department": department})
-    candidates.append({})
-
-    for c in candidates:
-        cur = db["routingrule"].find(c)
-        for rule in cur:
-            thr = rule.get("spend_threshold")
-            if thr is None or (spend or 0) >= float(thr):
-                return rule
+# Routing rules change rarely; cache the ordered candidate rules per
+# (department, type_code). The TTL bounds staleness across workers.
+_rule_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+
+async def _candidate_rules(department: str, type_code: str) -> Tuple[Dict[str, Any], ...]:
+    key = (department, type_code)
+    rules = _rule_cache.get(key)
+    if rules is not None:
+        return rules
+
+    # A rule with no department/type_code is a wildcard for that field.
+    # Rank matches by specificity server-side: department + type > type > department > catch-all.
+    wildcard = {"$in": [None, ""]}
+    pipeline = [
+        {"$match": {"$or": [
+            {"department": department, "type_code": type_code},
+            {"department": wildcard, "type_code": type_code},
+            {"department": department, "type_code": wildcard},
+            {"department": wildcard, "type_code": wildcard},
+        ]}},
+        {"$addFields": {"_specificity": {"$add": [
+            {"$cond": [{"$eq": [{"$ifNull": ["$department", ""]}, ""]}, 0, 1]},
+            {"$cond": [{"$eq": [{"$ifNull": ["$type_code", ""]}, ""]}, 0, 2]},
+        ]}}},
+        {"$sort": {"_specificity": -1, "_id": 1}},
+        {"$project": {"_specificity": 0}},
+    ]
+    rules = tuple(await db["routingrule"].aggregate(pipeline).to_list(length=None))
+    _rule_cache[key] = rules
+    return rules
+
+
+async def select_routing_rule(department: str, type_code: str, spend: Optional[float]) -> Optional[Dict[str, Any]]:
+    for rule in await _candidate_rules(department, type_code):
+        thr = rule.get("spend_threshold")
+        if thr is None or (spend or 0) >= float(thr):
+            return dict(rule)
     return None
 
 
+# Background writes --------------------------------------
+
+# Audit entries and outgoing emails are not needed to answer the request,
+# so handlers only enqueue them; _flush_queue batches them into insert_many.
+# Bounded so a stalled database can't grow memory without limit
+QUEUE_MAXSIZE = 10000
+AUDIT_Q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+EMAIL_Q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+FLUSH_INTERVAL = 0.05
+FLUSH_BATCH_SIZE = 500
+# Audit/email docs are best-effort, so don't wait for the server to acknowledge them
+UNACKNOWLEDGED = WriteConcern(w=0)
+
+_flushers: List[asyncio.Task] = []
+
+
+async def _write_batch(collection: str, batch: List[Dict[str, Any]]):
+    try:
+        await db.get_collection(collection, write_concern=UNACKNOWLEDGED).insert_many(batch, ordered=False)
+    except Exception:
+        # Includes encoding errors (e.g. InvalidDocument); the flusher must keep running
+        logger.exception("Failed to write %d %s documents", len(batch), collection)
+
+
+def _enqueue(queue: asyncio.Queue, collection: str, doc: Dict[str, Any]):
+    try:
+        queue.put_nowait(doc)
+    except asyncio.QueueFull:
+        logger.error("%s queue full, dropping document", collection)
+
+
+async def _flush_queue(queue: asyncio.Queue, collection: str):
+    loop = asyncio.get_running_loop()
+    while True:
+        doc = await queue.get()
+        if doc is None:
+            return
+        batch = [doc]
+        deadline = loop.time() + FLUSH_INTERVAL
+        stop = False
+        while len(batch) < FLUSH_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                doc = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if doc is None:
+                stop = True
+                break
+            batch.append(doc)
+        await _write_batch(collection, batch)
+        if stop:
+            return
+
+
 # Audit helper -------------------------------------------
 
-def log_audit(entity: str, entity_id: str, action: str, actor: str, details: Dict[str, Any] = None):
-    doc = {
+def log_audit(entity: str, entity_id: ObjectId, action: str, actor: str, details: Dict[str, Any] = None):
+    _enqueue(AUDIT_Q, "auditlog", {
         "entity": entity,
         "entity_id": entity_id,
         "action": action,
         "actor_email": actor,
         "details": details or {},
         "timestamp": datetime.now(timezone.utc),
-    }
-    db["auditlog"].insert_one(doc)
+    })
 
 
 # Email stub ---------------------------------------------
 
 def send_email_stub(to: List[str], subject: str, html: str):
-    db["emailoutbox"].insert_one({
+    _enqueue(EMAIL_Q, "emailoutbox", {
         "to": to,
         "subject": subject,
         "html": html,
@@ -132,14 +310,139 @@ def send_email_stub(to: List[str], subject: str, html: str):
     })
 
 
+# Data migrations ----------------------------------------
+
+def _to_object_id(field: str) -> List[Dict[str, Any]]:
+    # Malformed ids are left as they were instead of failing the whole update
+    return [{"$set": {field: {"$convert": {"input": f"${field}", "to": "objectId", "onError": f"${field}"}}}}]
+
+
+async def migrate_justification_refs():
+    # Older child documents stored the justification id as a hex string
+    await db["approvaltask"].update_many({"justification_id": {"$type": "string"}}, _to_object_id("justification_id"))
+    await db["comment"].update_many({"justification_id": {"$type": "string"}}, _to_object_id("justification_id"))
+    await db["auditlog"].update_many(
+        {"entity": "justification", "entity_id": {"$type": "string"}},
+        _to_object_id("entity_id"),
+    )
+
+
+async def backfill_pending_count():
+    # Justifications created before pending_count existed: count their open steps
+    await db["justification"].aggregate([
+        {"$match": {"pending_count": {"$exists": False}}},
+        {"$lookup": {
+            "from": "approvaltask",
+            "let": {"j": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    ref_matches("$justification_id"),
+                    {"$ne": ["$status", "Approved"]},
+                ]}}},
+                {"$count": "n"},
+            ],
+            "as": "pending",
+        }},
+        {"$project": {"pending_count": {"$ifNull": [{"$arrayElemAt": ["$pending.n", 0]}, 0]}}},
+        {"$merge": {"into": "justification", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ]).to_list(length=None)
+
+
+# Applied in order; each is recorded in the migration collection once it completes
+MIGRATIONS = [
+    ("justification_refs_objectid", migrate_justification_refs),
+    ("justification_pending_count", backfill_pending_count),
+]
+
+
+# Startup ------------------------------------------------
+
+INDEXES = [
+    ("justification", [("requester_email", 1), ("status", 1), ("created_at", -1), ("_id", -1)]),
+    ("justification", [("status", 1), ("created_at", -1), ("_id", -1)]),
+    ("justification", [("created_at", -1), ("_id", -1)]),
+    # A requester's own dashboard leaves status unconstrained, which the
+    # (requester_email, status, ...) index can't serve in sorted order
+    ("justification", [("requester_email", 1), ("created_at", -1), ("_id", -1)]),
+    ("approvaltask", [("approver_email", 1), ("status", 1), ("created_at", -1)]),
+    ("approvaltask", [("justification_id", 1), ("step_index", 1)]),
+    ("comment", [("justification_id", 1), ("created_at", 1)]),
+    ("auditlog", [("entity", 1), ("entity_id", 1), ("timestamp", 1)]),
+    ("routingrule", [("department", 1), ("type_code", 1), ("spend_threshold", 1)]),
+    ("routingrule", [("name", 1)]),
+]
+
+
+@app.on_event("startup")
+async def ensure_indexes():
+    # Like the migrations, a failure here is logged and the app still boots
+    # (e.g. Mongo unreachable; /test reports it)
+    if db is None:
+        return
+    for collection, keys in INDEXES:
+        try:
+            await db[collection].create_index(keys)
+        except ConnectionFailure:
+            # Every remaining index would wait out the same server selection timeout
+            logger.exception("Database unreachable, skipping index creation")
+            return
+        except Exception:
+            logger.exception("Failed to create index %s on %s", keys, collection)
+
+
+@app.on_event("startup")
+async def run_migrations():
+    if db is None:
+        return
+    done = {m["_id"] async for m in db["migration"].find({}, {"_id": 1})}
+    for name, migrate in MIGRATIONS:
+        if name in done:
+            continue
+        try:
+            await migrate()
+        except Exception:
+            # Leave it unmarked so the next start retries; later migrations depend on it
+            logger.exception("Migration %s failed", name)
+            return
+        await db["migration"].update_one(
+            {"_id": name},
+            {"$setOnInsert": {"applied_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+
+
+def _log_flusher_exit(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background flusher stopped", exc_info=task.exception())
+
+
+@app.on_event("startup")
+async def start_flushers():
+    if db is None:
+        return
+    for queue, collection in ((AUDIT_Q, "auditlog"), (EMAIL_Q, "emailoutbox")):
+        task = asyncio.create_task(_flush_queue(queue, collection))
+        task.add_done_callback(_log_flusher_exit)
+        _flushers.append(task)
+
+
+@app.on_event("shutdown")
+async def stop_flushers():
+    # The sentinel is queued behind pending documents, so they are written first
+    for queue in (AUDIT_Q, EMAIL_Q):
+        await queue.put(None)
+    await asyncio.gather(*_flushers)
+    _flushers.clear()
+
+
 # Routes --------------------------------------------------
 @app.get("/")
-def root():
+async def root():
     return {"name": "Justifi API", "status": "ok"}
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -155,7 +458,7 @@ def test_database():
             response["database_name"] = os.getenv("DATABASE_NAME") or "❌ Not Set"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:20]
             except Exception as e:
                 response["database"] = f"⚠️ Connected but Error: {str(e)[:80]}"
@@ -165,177 +468,309 @@ def test_database():
 
 
 @app.post("/api/justifications")
-def create_justification(payload: JustificationCreate):
-    data = payload.model_dump()
-    data.update({
-        "status": "PendingApproval",
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
-    })
-    jid = db["justification"].insert_one(data).inserted_id
-    jid_str = str(jid)
+async def create_justification(payload: JustificationCreate):
+    now = datetime.now(timezone.utc)
 
     # Routing
-    rule = select_routing_rule(payload.department, payload.type_code, payload.cost_estimate)
+    rule = await select_routing_rule(payload.department, payload.type_code, payload.cost_estimate)
     approvers: List[str] = []
     if rule and rule.get("approver_emails"):
         approvers = [a for a in rule["approver_emails"] if a]
 
-    # Create approval tasks sequentially
-    for idx, email in enumerate(approvers):
-        db["approvaltask"].insert_one({
-            "justification_id": jid_str,
+    # No nested models, so a shallow copy of the fields matches model_dump()
+    data = payload.__dict__.copy()
+    data.update({
+        "status": "PendingApproval",
+        "pending_count": len(approvers),
+        "created_at": now,
+        "updated_at": now,
+    })
+    oid = (await db["justification"].insert_one(data)).inserted_id
+    invalidate_list_cache()
+
+    # Create approval tasks (sequential steps) in one batch
+    if approvers:
+        docs = [{
+            "justification_id": oid,
             "approver_email": email,
             "step_index": idx,
             "status": "Pending",
-            "created_at": datetime.now(timezone.utc),
-        })
+            "created_at": now,
+        } for idx, email in enumerate(approvers)]
+        try:
+            await db["approvaltask"].insert_many(docs, ordered=False)
+        except PyMongoError:
+            logger.exception("Failed to create approval tasks for justification %s", oid)
+            # Roll back: without all its tasks pending_count could never reach 0
+            try:
+                await db["approvaltask"].delete_many({"justification_id": oid})
+                await db["justification"].delete_one({"_id": oid})
+            except PyMongoError:
+                logger.exception("Failed to roll back justification %s", oid)
+            invalidate_list_cache()
+            raise HTTPException(500, "Failed to create approval tasks")
 
     # Emails
     if approvers:
         send_email_stub(approvers, "New approval request", f"Justification {payload.title} requires your approval.")
     send_email_stub([payload.requester_email], "Submission received", f"Your justification '{payload.title}' has been submitted.")
 
-    log_audit("justification", jid_str, "CREATE", payload.requester_email, {"title": payload.title})
+    log_audit("justification", oid, "CREATE", payload.requester_email, {"title": payload.title})
+
+    return {"id": str(oid)}
 
-    return {"id": jid_str}
 
+@app.get("/api/justifications", response_model=None)
+async def list_justifications(
+    requester_email: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+):
+    # Keyset pagination on (created_at, _id): pass the previous page's
+    # next_before ("<ISO created_at>,<id>") as before to get the next page
+    key = (requester_email, status, limit, before)
+    body = _list_cache.get(key)
+    if body is not None:
+        return Response(body, media_type="application/json")
+    generation = _list_generation
 
-@app.get("/api/justifications")
-def list_justifications(requester_email: Optional[str] = None, status: Optional[str] = None):
     q: Dict[str, Any] = {}
     if requester_email:
         q["requester_email"] = requester_email
     if status:
         q["status"] = status
-    items = [serialize_id(d) for d in db["justification"].find(q).sort("created_at", -1)]
-    return items
+    if before:
+        created_at, _, last_id = before.partition(",")
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise HTTPException(400, "before must be a next_before value")
+        if not ObjectId.is_valid(last_id):
+            raise HTTPException(400, "before must be a next_before value")
+        q["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": ObjectId(last_id)}},
+        ]
+    cur = db["justification"].find(q, JUSTIFICATION_SUMMARY_PROJECTION).sort([("created_at", -1), ("_id", -1)]).limit(limit)
+    items = [serialize_id(d) async for d in cur]
+    next_before = None
+    if len(items) == limit:
+        last = items[-1]
+        next_before = f"{last['created_at'].isoformat()},{last['id']}"
+    response = MongoJSONResponse({"items": items, "next_before": next_before})
+    if generation == _list_generation:
+        _list_cache[key] = response.body
+    return response
 
 
-@app.get("/api/justifications/{jid}")
-def get_justification(jid: str):
-    doc = db["justification"].find_one({"_id": ObjectId(jid)})
+@app.get("/api/justifications/{jid}", response_model=None)
+async def get_justification(jid: str):
+    # Single round-trip: join tasks, comments and audit entries server-side
+    pipeline = [
+        {"$match": {"_id": parse_object_id(jid)}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "approvaltask",
+            "let": {"j": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": ref_matches("$justification_id")}},
+                {"$sort": {"step_index": 1}},
+            ],
+            "as": "approval_tasks",
+        }},
+        {"$lookup": {
+            "from": "comment",
+            "let": {"j": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": ref_matches("$justification_id")}},
+                {"$sort": {"created_at": 1}},
+            ],
+            "as": "comments",
+        }},
+        {"$lookup": {
+            "from": "auditlog",
+            "let": {"j": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$entity", "justification"]},
+                    ref_matches("$entity_id"),
+                ]}}},
+                {"$sort": {"timestamp": 1}},
+            ],
+            "as": "audit",
+        }},
+    ]
+    docs = await db["justification"].aggregate(pipeline).to_list(length=1)
+    doc = docs[0] if docs else None
     if not doc:
         raise HTTPException(404, "Not found")
+    tasks = [serialize_id(t) for t in doc.pop("approval_tasks")]
+    comments = [serialize_id(c) for c in doc.pop("comments")]
+    audits = [serialize_id(a) for a in doc.pop("audit")]
     just = serialize_id(doc)
-    tasks = [serialize_id(t) for t in db["approvaltask"].find({"justification_id": jid}).sort("step_index", 1)]
-    comments = [serialize_id(c) for c in db["comment"].find({"justification_id": jid}).sort("created_at", 1)]
-    audits = [serialize_id(a) for a in db["auditlog"].find({"entity": "justification", "entity_id": jid}).sort("timestamp", 1)]
     just.update({"approval_tasks": tasks, "comments": comments, "audit": audits})
-    return just
-
-
-@app.get("/api/inbox")
-def approver_inbox(approver_email: str):
-    tasks = list(db["approvaltask"].find({"approver_email": approver_email, "status": {"$in": ["Pending", "NeedsMoreInfo"]}}).sort("created_at", -1))
-    grouped: Dict[str, List[Dict[str, Any]]] = {}
-    for t in tasks:
-        grouped.setdefault(t["justification_id"], []).append(t)
-    result = []
-    for jid, arr in grouped.items():
-        next_task = sorted(arr, key=lambda x: x.get("step_index", 0))[0]
-        just = db["justification"].find_one({"_id": ObjectId(jid)})
-        result.append({
-            "task": serialize_id(next_task),
-            "justification": serialize_id(just) if just else None,
-        })
-    return result
+    return MongoJSONResponse(just)
+
+
+@app.get("/api/inbox", response_model=None)
+async def approver_inbox(approver_email: str):
+    # Earliest open step per justification, joined to its summary, in one round-trip
+    pipeline = [
+        {"$match": {"approver_email": approver_email, "status": {"$in": ["Pending", "NeedsMoreInfo"]}}},
+        {"$sort": {"step_index": 1}},
+        {"$group": {
+            "_id": {"$convert": {"input": "$justification_id", "to": "objectId", "onError": "$justification_id"}},
+            "task": {"$first": "$$ROOT"},
+        }},
+        {"$lookup": {
+            "from": "justification",
+            "let": {"j": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$j"]}}},
+                {"$project": INBOX_JUSTIFICATION_PROJECTION},
+            ],
+            "as": "justification",
+        }},
+        {"$unwind": {"path": "$justification", "preserveNullAndEmptyArrays": True}},
+        {"$sort": {"task.created_at": -1}},
+    ]
+    result = [{
+        "task": serialize_id(row["task"]),
+        "justification": serialize_id(row.get("justification")),
+    } async for row in db["approvaltask"].aggregate(pipeline)]
+    return MongoJSONResponse(result)
 
 
 @app.post("/api/approvals/{task_id}/approve")
-def approve_task(task_id: str, action: ApproverAction):
-    task = db["approvaltask"].find_one({"_id": ObjectId(task_id)})
+async def approve_task(task_id: str, action: ApproverAction):
+    now = datetime.now(timezone.utc)
+    task = await db["approvaltask"].find_one({"_id": parse_object_id(task_id)})
     if not task:
         raise HTTPException(404, "Task not found")
-    jid = task["justification_id"]
-
-    db["approvaltask"].update_one({"_id": task["_id"]}, {"$set": {"status": "Approved", "updated_at": datetime.now(timezone.utc)}})
-    log_audit("justification", jid, "APPROVE", action.actor_email, {"task_id": task_id, "comment": action.comment})
-
-    # Check if all steps approved
-    remaining = db["approvaltask"].count_documents({"justification_id": jid, "status": {"$ne": "Approved"}})
-    if remaining == 0:
-        db["justification"].update_one({"_id": ObjectId(jid)}, {"$set": {"status": "Approved", "updated_at": datetime.now(timezone.utc)}})
-        just = db["justification"].find_one({"_id": ObjectId(jid)})
+    oid = justification_ref(task)
+
+    res = await db["approvaltask"].update_one(
+        {"_id": task["_id"], "status": {"$ne": "Approved"}},
+        {"$set": {"status": "Approved", "updated_at": now}},
+    )
+    log_audit("justification", oid, "APPROVE", action.actor_email, {"task_id": task_id, "comment": action.comment})
+    if res.modified_count == 0:
+        # Already approved; don't count it twice
+        return {"ok": True}
+
+    # Atomically count down outstanding steps; only the last approver sees 0
+    just = await db["justification"].find_one_and_update(
+        {"_id": oid},
+        {"$inc": {"pending_count": -1}, "$set": {"updated_at": now}},
+        projection={"pending_count": 1, **REQUESTER_PROJECTION},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not just:
+        raise HTTPException(404, "Justification not found")
+    if just.get("pending_count") == 0:
+        await db["justification"].update_one({"_id": just["_id"]}, {"$set": {"status": "Approved", "updated_at": now}})
         send_email_stub([just.get("requester_email")], "Final approval", f"Your justification '{just.get('title')}' is approved.")
+    invalidate_list_cache()
     return {"ok": True}
 
 
 @app.post("/api/approvals/{task_id}/reject")
-def reject_task(task_id: str, action: ApproverAction):
+async def reject_task(task_id: str, action: ApproverAction):
+    now = datetime.now(timezone.utc)
     if not action.comment:
         raise HTTPException(400, "Rejection requires a reason in comment")
-    task = db["approvaltask"].find_one({"_id": ObjectId(task_id)})
+    task = await db["approvaltask"].find_one({"_id": parse_object_id(task_id)})
     if not task:
         raise HTTPException(404, "Task not found")
-    jid = task["justification_id"]
-
-    db["approvaltask"].update_one({"_id": task["_id"]}, {"$set": {"status": "Rejected", "updated_at": datetime.now(timezone.utc)}})
-    db["justification"].update_one({"_id": ObjectId(jid)}, {"$set": {"status": "Rejected", "updated_at": datetime.now(timezone.utc)}})
-    log_audit("justification", jid, "REJECT", action.actor_email, {"task_id": task_id, "comment": action.comment})
+    oid = justification_ref(task)
+
+    await db["approvaltask"].update_one({"_id": task["_id"]}, {"$set": {"status": "Rejected", "updated_at": now}})
+    just = await db["justification"].find_one_and_update(
+        {"_id": oid},
+        {"$set": {"status": "Rejected", "updated_at": now}},
+        projection=REQUESTER_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not just:
+        raise HTTPException(404, "Justification not found")
+    invalidate_list_cache()
+    log_audit("justification", oid, "REJECT", action.actor_email, {"task_id": task_id, "comment": action.comment})
 
-    just = db["justification"].find_one({"_id": ObjectId(jid)})
     send_email_stub([just.get("requester_email")], "Rejected", f"Your justification '{just.get('title')}' was rejected. Reason: {action.comment}")
     return {"ok": True}
 
 
 @app.post("/api/approvals/{task_id}/request-info")
-def request_info(task_id: str, action: RequestInfoAction):
-    task = db["approvaltask"].find_one({"_id": ObjectId(task_id)})
+async def request_info(task_id: str, action: RequestInfoAction):
+    now = datetime.now(timezone.utc)
+    task = await db["approvaltask"].find_one({"_id": parse_object_id(task_id)})
     if not task:
         raise HTTPException(404, "Task not found")
-    jid = task["justification_id"]
-    db["approvaltask"].update_one({"_id": task["_id"]}, {"$set": {"status": "NeedsMoreInfo", "requested_more_info": action.reason, "updated_at": datetime.now(timezone.utc)}})
-    db["justification"].update_one({"_id": ObjectId(jid)}, {"$set": {"status": "NeedsMoreInfo", "updated_at": datetime.now(timezone.utc)}})
+    oid = justification_ref(task)
+    await db["approvaltask"].update_one({"_id": task["_id"]}, {"$set": {"status": "NeedsMoreInfo", "requested_more_info": action.reason, "updated_at": now}})
+    just = await db["justification"].find_one_and_update(
+        {"_id": oid},
+        {"$set": {"status": "NeedsMoreInfo", "updated_at": now}},
+        projection=REQUESTER_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not just:
+        raise HTTPException(404, "Justification not found")
+    invalidate_list_cache()
 
-    just = db["justification"].find_one({"_id": ObjectId(jid)})
     send_email_stub([just.get("requester_email")], "More information requested", f"Approver requested more info: {action.reason}")
 
-    log_audit("justification", jid, "REQUEST_INFO", action.actor_email, {"task_id": task_id, "reason": action.reason})
+    log_audit("justification", oid, "REQUEST_INFO", action.actor_email, {"task_id": task_id, "reason": action.reason})
     return {"ok": True}
 
 
 @app.post("/api/justifications/{jid}/resubmit")
-def resubmit(jid: str, payload: ResubmitPayload):
-    just = db["justification"].find_one({"_id": ObjectId(jid)})
+async def resubmit(jid: str, payload: ResubmitPayload):
+    now = datetime.now(timezone.utc)
+    oid = parse_object_id(jid)
+    just = await db["justification"].find_one({"_id": oid})
     if not just:
         raise HTTPException(404, "Not found")
-    db["justification"].update_one({"_id": just["_id"]}, {"$set": {"status": "PendingApproval", "updated_at": datetime.now(timezone.utc)}})
-    db["approvaltask"].update_many({"justification_id": jid, "status": "NeedsMoreInfo"}, {"$set": {"status": "Pending", "updated_at": datetime.now(timezone.utc)}})
+    await db["justification"].update_one({"_id": just["_id"]}, {"$set": {"status": "PendingApproval", "updated_at": now}})
+    invalidate_list_cache()
+    await db["approvaltask"].update_many({"justification_id": {"$in": [oid, jid]}, "status": "NeedsMoreInfo"}, {"$set": {"status": "Pending", "updated_at": now}})
 
-    log_audit("justification", jid, "RESUBMIT", payload.actor_email, {"message": payload.message})
+    log_audit("justification", oid, "RESUBMIT", payload.actor_email, {"message": payload.message})
     send_email_stub([payload.actor_email], "Resubmitted", "Your justification was resubmitted.")
     return {"ok": True}
 
 
 @app.post("/api/justifications/{jid}/comments")
-def add_comment(jid: str, payload: CommentCreate):
-    if not db["justification"].find_one({"_id": ObjectId(jid)}):
+async def add_comment(jid: str, payload: CommentCreate):
+    oid = parse_object_id(jid)
+    if not await db["justification"].find_one({"_id": oid}):
         raise HTTPException(404, "Justification not found")
-    cid = db["comment"].insert_one({
-        "justification_id": jid,
+    cid = (await db["comment"].insert_one({
+        "justification_id": oid,
         "author_email": payload.author_email,
         "message": payload.message,
         "is_internal": payload.is_internal,
         "created_at": datetime.now(timezone.utc),
-    }).inserted_id
-    log_audit("justification", jid, "COMMENT", payload.author_email, {"comment_id": str(cid)})
+    })).inserted_id
+    log_audit("justification", oid, "COMMENT", payload.author_email, {"comment_id": str(cid)})
     return {"id": str(cid)}
 
 
-@app.get("/api/rules")
-def list_rules():
-    return [serialize_id(r) for r in db["routingrule"].find({}).sort("name", 1)]
+@app.get("/api/rules", response_model=None)
+async def list_rules():
+    return MongoJSONResponse([serialize_id(r) async for r in db["routingrule"].find({}).sort("name", 1)])
 
 
 @app.post("/api/rules")
-def create_rule(rule: Dict[str, Any]):
+async def create_rule(rule: Dict[str, Any]):
     if not rule.get("name"):
         raise HTTPException(400, "name required")
-    rid = db["routingrule"].insert_one({
+    rid = (await db["routingrule"].insert_one({
         **rule,
         "created_at": datetime.now(timezone.utc),
-    }).inserted_id
+    })).inserted_id
+    _rule_cache.clear()
     return {"id": str(rid)}
 
 